@@ -4,12 +4,14 @@ import { envType } from "./envType";
 import kleur = require("kleur");
 
 function displayPostgresInstructions(postgresTableName: string) {
+  // Indexes are created in the table's schema, so their names are unqualified
+  const indexPrefix = `ix_${postgresTableName.split(".").pop()}`;
   const sqlCode = `
 SQL Code to Create the Table:
 The default table name is "elements". If you selected a different table name, please confirm the SQL code before running.
 If you do not already have a table created with the correct schema, you can execute the following SQL code:
 
--- Step 1: Create the vector extension (if not already created)
+-- Step 1: Create the vector extension (if not already created; halfvec needs pgvector 0.7+)
 CREATE EXTENSION IF NOT EXISTS vector;
 
 -- Step 2: Drop the existing elements table (if necessary)
@@ -20,7 +22,7 @@ CREATE TABLE ${postgresTableName} (
     id UUID PRIMARY KEY,
     element_id VARCHAR,
     text TEXT,
-    embeddings VECTOR(768),
+    embeddings HALFVEC(768),
     type VARCHAR,
     system VARCHAR,
     layout_width INTEGER,
@@ -57,6 +59,14 @@ CREATE TABLE ${postgresTableName} (
     regex_metadata TEXT[],
     detection_class_prob FLOAT
 );
+
+-- Step 4: Index the filename column, which updates and deletes filter on
+CREATE INDEX IF NOT EXISTS ${indexPrefix}_filename ON ${postgresTableName} (filename);
+
+To add the filename index to a table that already holds data, without blocking writes to it, run this instead
+of Steps 2-4 (outside a transaction block), or run lambda/s3_postgres_lambda/migrate_filename_index.py:
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ${indexPrefix}_filename ON ${postgresTableName} (filename);
   `;
 
   console.log(
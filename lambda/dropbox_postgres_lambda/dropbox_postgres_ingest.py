@@ -9,10 +9,10 @@ from unstructured_ingest.v2.processes.connectors.sql.postgres import (
     PostgresConnectionConfig,
     PostgresAccessConfig,
     PostgresUploaderConfig,
-    PostgresUploadStagerConfig
 )
 from unstructured_ingest.v2.processes.chunker import ChunkerConfig
-from unstructured_ingest.v2.processes.embedder import EmbedderConfig
+
+from postgres_ingest_utils import CopyPostgresUploader, build_embedder_config, check_embedder_dimensions
 
 if __name__ == "__main__":
     metadata_includes = [
@@ -28,7 +28,12 @@ if __name__ == "__main__":
 
     # Prepare the configuration dictionary
     pipeline_configs = {
-        "context": ProcessorConfig(),
+        # Files are downloaded, partitioned and embedded by a pool of worker
+        # processes. Each one loads its own embedding model, so it stays at
+        # ProcessorConfig's default of 2 unless INGEST_NUM_PROCESSES says otherwise.
+        "context": ProcessorConfig(
+            num_processes=int(os.getenv("INGEST_NUM_PROCESSES") or 2),
+        ),
         "indexer_config": DropboxIndexerConfig(remote_url=os.getenv("DROPBOX_REMOTE_URL")),
         "downloader_config": DropboxDownloaderConfig(download_dir=os.getenv("LOCAL_FILE_DOWNLOAD_DIR")),
         "source_connection_config": DropboxConnectionConfig(
@@ -39,11 +44,7 @@ if __name__ == "__main__":
         "partitioner_config": PartitionerConfig(
             partition_by_api=False
         ),
-        "embedder_config": EmbedderConfig(
-            embedding_provider=os.getenv("EMBEDDING_PROVIDER"),
-            embedding_model_name=os.getenv("EMBEDDING_MODEL_NAME"),
-            embedding_api_key=os.getenv("EMBEDDING_PROVIDER_API_KEY")
-        ),
+        "embedder_config": build_embedder_config(),
         "destination_connection_config": PostgresConnectionConfig(
             access_config=PostgresAccessConfig(password=os.getenv("POSTGRES_PASSWORD")),
             host=os.getenv("POSTGRES_HOST"),
@@ -51,7 +52,6 @@ if __name__ == "__main__":
             username=os.getenv("POSTGRES_USER"),
             database=os.getenv("POSTGRES_DB_NAME")
         ),
-        "stager_config": PostgresUploadStagerConfig(),
         "uploader_config": PostgresUploaderConfig(table_name=os.getenv("POSTGRES_TABLE_NAME"))
     }
 
@@ -63,5 +63,12 @@ if __name__ == "__main__":
             chunk_overlap=20
         )
 
+    check_embedder_dimensions(pipeline_configs["embedder_config"], os.getenv("POSTGRES_TABLE_NAME"))
 
-    Pipeline.from_configs(**pipeline_configs).run()
+    pipeline = Pipeline.from_configs(**pipeline_configs)
+    # No stager: the uploader reads the embedder output and COPYs it directly
+    pipeline.uploader_step.process = CopyPostgresUploader(
+        upload_config=pipeline_configs["uploader_config"],
+        connection_config=pipeline_configs["destination_connection_config"],
+    )
+    pipeline.run()
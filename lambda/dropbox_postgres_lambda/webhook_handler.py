@@ -13,9 +13,6 @@ logger.setLevel(logging.INFO)
 dynamodb = boto3.client('dynamodb')
 batch_client = boto3.client('batch')
 
-with open('dropbox_postgres_ingest.py', 'r') as script_file:
-    app_script = script_file.read()
-
 def get_token_data():
     table_name = os.environ['DYNAMODB_TABLE_NAME']
     response = dynamodb.get_item(
@@ -95,6 +92,9 @@ def add_files(access_token):
     embedding_provider = os.environ['EMBEDDING_PROVIDER']
     chunking_strategy = os.environ['CHUNKING_STRATEGY']
     chunking_max_characters = os.environ['CHUNKING_MAX_CHARACTERS']
+    ingest_num_processes = os.environ.get('INGEST_NUM_PROCESSES', '')
+    embedding_batch_size = os.environ.get('EMBEDDING_BATCH_SIZE', '')
+    embedding_torch_dtype = os.environ.get('EMBEDDING_TORCH_DTYPE', '')
     local_file_download_dir = '/tmp/'  # Temporary directory for Lambda file storage
 
     # Generate a valid job name
@@ -114,6 +114,9 @@ def add_files(access_token):
                 {'name': 'EMBEDDING_PROVIDER_API_KEY', 'value': embedding_provider_api_key},
                 {'name': 'CHUNKING_STRATEGY', 'value': chunking_strategy},
                 {'name': 'CHUNKING_MAX_CHARACTERS', 'value': chunking_max_characters},
+                {'name': 'INGEST_NUM_PROCESSES', 'value': ingest_num_processes},
+                {'name': 'EMBEDDING_BATCH_SIZE', 'value': embedding_batch_size},
+                {'name': 'EMBEDDING_TORCH_DTYPE', 'value': embedding_torch_dtype},
                 {'name': 'POSTGRES_DB_NAME', 'value': db_name},
                 {'name': 'POSTGRES_USER', 'value': user},
                 {'name': 'POSTGRES_PASSWORD', 'value': password},
@@ -121,7 +124,6 @@ def add_files(access_token):
                 {'name': 'POSTGRES_PORT', 'value': port},
                 {'name': 'POSTGRES_TABLE_NAME', 'value': table_name},
                 {'name': 'LOCAL_FILE_DOWNLOAD_DIR', 'value': local_file_download_dir},
-                {'name': 'APP_SCRIPT', 'value': app_script},
             ],
         },
     )
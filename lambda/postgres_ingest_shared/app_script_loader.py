@@ -0,0 +1,41 @@
+# Runs as the APP_SCRIPT of every Postgres ingest job. The job scripts are
+# published as S3 assets instead of being inlined in each job's container
+# overrides, which Batch caps at 8192 characters. This loader downloads the
+# script named by APP_SCRIPT_S3_KEY and runs it, after making the shared
+# postgres_ingest_utils module (APP_MODULE_S3_KEY) importable.
+#
+# The download is signed with the job role's credentials: the job environment
+# may also carry AWS keys for the data source, which botocore's default
+# credential chain would otherwise pick first.
+import os
+import sys
+import tempfile
+
+import botocore.session
+from botocore.credentials import ContainerProvider
+
+job_role_credentials = ContainerProvider().load().get_frozen_credentials()
+app_script_s3_client = botocore.session.get_session().create_client(
+    "s3",
+    region_name=os.environ["APP_SCRIPT_S3_REGION"],
+    aws_access_key_id=job_role_credentials.access_key,
+    aws_secret_access_key=job_role_credentials.secret_key,
+    aws_session_token=job_role_credentials.token,
+)
+
+
+def read_app_script_asset(key):
+    response = app_script_s3_client.get_object(Bucket=os.environ["APP_SCRIPT_S3_BUCKET"], Key=key)
+    return response["Body"].read().decode("utf-8")
+
+
+# Written to a file rather than exec'd, so that worker processes can import
+# the classes the pipeline pickles for them
+app_module_dir = tempfile.mkdtemp()
+with open(os.path.join(app_module_dir, "postgres_ingest_utils.py"), "w") as module_file:
+    module_file.write(read_app_script_asset(os.environ["APP_MODULE_S3_KEY"]))
+sys.path.insert(0, app_module_dir)
+
+app_script_key = os.environ["APP_SCRIPT_S3_KEY"]
+# Run in this module's namespace, so the script sees __name__ == "__main__"
+exec(compile(read_app_script_asset(app_script_key), app_script_key, "exec"), globals())
@@ -0,0 +1,554 @@
+# lambda/postgres_ingest_shared/postgres_ingest_utils.py
+
+# Code shared by the Postgres ingest scripts (s3_postgres_ingest.py and
+# dropbox_postgres_ingest.py). It is published as its own S3 asset, and
+# app_script_loader.py puts it on the import path before running a script.
+
+import abc
+import functools
+import json
+import os
+import tempfile
+import uuid
+from datetime import datetime, timezone
+
+import numpy as np
+import psycopg2
+import psycopg2.sql
+from unstructured_ingest.v2.processes.connectors.sql.postgres import PostgresUploader
+from unstructured_ingest.v2.processes.embedder import EmbedderConfig
+
+# Custom embedding providers, selected through EMBEDDING_PROVIDER:
+# - "static" swaps the transformer forward pass for a Model2Vec static model (a
+#   token embedding lookup plus mean pooling), far cheaper on CPU-only workers.
+# - "huggingface" runs the transformer directly, tokenizing all chunks at once
+#   and pooling as the model's sentence-transformers config declares.
+# Any other provider falls back to the stock Unstructured embedder.
+STATIC_EMBEDDING_PROVIDER = "static"
+# potion-base-8M produces 256-dimensional vectors, so the table's embeddings
+# column must be declared VECTOR(256) / HALFVEC(256) to use it
+DEFAULT_STATIC_MODEL_NAME = "minishlab/potion-base-8M"
+HUGGINGFACE_EMBEDDING_PROVIDER = "huggingface"
+
+# Chunks per forward pass, overridable through EMBEDDING_BATCH_SIZE. The
+# pipeline hands the embedder one file's chunks at a time, so a batch never
+# spans files.
+HUGGINGFACE_BATCH_SIZE = int(os.getenv("EMBEDDING_BATCH_SIZE") or 32)
+
+# Cap on the total characters in one Hugging Face batch, so a run of very long
+# chunks doesn't blow past device memory
+HUGGINGFACE_BATCH_MAX_CHARACTERS = 150_000
+
+# sentence-transformers modules HuggingFaceEmbeddingEncoder reproduces. Models
+# whose modules.json lists anything else (e.g. a Dense projection) go through
+# the stock embedder, as do models without a sentence-transformers config.
+SENTENCE_TRANSFORMERS_MODULES = {
+    "sentence_transformers.models.Transformer",
+    "sentence_transformers.models.Pooling",
+    "sentence_transformers.models.Normalize",
+}
+# Pooling modes HuggingFaceEmbeddingEncoder implements, keyed by their flag in
+# the Pooling module's config.json
+POOLING_MODES = {"pooling_mode_cls_token": "cls", "pooling_mode_mean_tokens": "mean"}
+
+
+# numba is optional in the job image; without it normalization uses plain
+# numpy. The kernel is cached on disk so that only the first process of a job
+# compiles it, and the default cache location beside the module may not be
+# writable, hence NUMBA_CACHE_DIR.
+os.environ.setdefault("NUMBA_CACHE_DIR", os.path.join(tempfile.gettempdir(), "numba_cache"))
+try:
+    from numba import njit, prange
+except ImportError:
+    njit = None
+
+if njit is not None:
+    @njit(parallel=True, fastmath=True, cache=True)
+    def normalize_rows(embeddings):
+        normalized = np.empty_like(embeddings)
+        for row in prange(embeddings.shape[0]):
+            norm = np.sqrt(np.sum(embeddings[row] * embeddings[row]))
+            normalized[row] = embeddings[row] / norm if norm > 0 else embeddings[row]
+        return normalized
+else:
+    normalize_rows = None
+
+
+def normalize_embeddings(embeddings):
+    # Returns unit-length copies of the vectors; the input is left untouched.
+    # The compiled kernel is typed for 2D float32 arrays, so a single vector
+    # goes through it as a one-row matrix.
+    embeddings = np.ascontiguousarray(embeddings, dtype=np.float32)
+    if embeddings.ndim == 1:
+        return normalize_embeddings(embeddings[np.newaxis, :])[0]
+    if normalize_rows is not None:
+        return normalize_rows(embeddings)
+    norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+    return embeddings / np.where(norms == 0, 1, norms)
+
+
+def get_element_text(element):
+    return element["text"] if isinstance(element, dict) else element.text
+
+
+def set_element_embeddings(element, embeddings):
+    if isinstance(element, dict):
+        element["embeddings"] = embeddings
+    else:
+        element.embeddings = embeddings
+
+
+@functools.lru_cache(maxsize=None)
+def load_static_model(model_name):
+    try:
+        from model2vec import StaticModel
+    except ImportError as error:
+        raise ImportError(
+            "EMBEDDING_PROVIDER=static requires the model2vec package in the job image"
+        ) from error
+    return StaticModel.from_pretrained(model_name)
+
+
+@functools.lru_cache(maxsize=None)
+def load_huggingface_model(model_name):
+    import torch
+    from transformers import AutoModel, AutoTokenizer
+
+    device = "cuda" if torch.cuda.is_available() else "cpu"
+    # bf16 halves the weight bytes streamed per forward pass. Many CPUs (e.g.
+    # Graviton2) have no fast bf16 matmul, so CPU workers stay on fp32 unless
+    # EMBEDDING_TORCH_DTYPE says otherwise.
+    dtype_name = os.getenv("EMBEDDING_TORCH_DTYPE") or ("bfloat16" if device == "cuda" else "float32")
+    tokenizer = AutoTokenizer.from_pretrained(model_name)
+    model = AutoModel.from_pretrained(model_name, torch_dtype=getattr(torch, dtype_name))
+    return tokenizer, model.to(device).eval()
+
+
+def read_model_config(model_name, filename):
+    # A JSON file from a local model directory or the Hugging Face Hub, or
+    # None if the model doesn't have it
+    if os.path.isdir(model_name):
+        config_path = os.path.join(model_name, filename)
+        if not os.path.exists(config_path):
+            return None
+    else:
+        from huggingface_hub import hf_hub_download
+        from huggingface_hub.utils import EntryNotFoundError
+
+        try:
+            config_path = hf_hub_download(model_name, filename)
+        except EntryNotFoundError:
+            return None
+    with open(config_path) as config_file:
+        return json.load(config_file)
+
+
+@functools.lru_cache(maxsize=None)
+def load_sentence_transformers_config(model_name):
+    # The pooling mode and maximum sequence length the model's
+    # sentence-transformers config declares, or None if
+    # HuggingFaceEmbeddingEncoder can't reproduce its sentence embeddings
+    modules = read_model_config(model_name, "modules.json")
+    if not modules or any(module["type"] not in SENTENCE_TRANSFORMERS_MODULES for module in modules):
+        return None
+    pooling_path = next(
+        (module["path"] for module in modules if module["type"] == "sentence_transformers.models.Pooling"),
+        None,
+    )
+    if pooling_path is None:
+        return None
+    pooling_config = read_model_config(model_name, f"{pooling_path}/config.json") or {}
+    enabled = [flag for flag, value in pooling_config.items() if flag.startswith("pooling_mode_") and value]
+    if len(enabled) != 1 or enabled[0] not in POOLING_MODES:
+        return None
+    # Often shorter than the tokenizer's own model_max_length (e.g. 256 vs 512
+    # for all-MiniLM-L6-v2); the model was trained on inputs truncated to it
+    sentence_config = read_model_config(model_name, "sentence_bert_config.json") or {}
+    return POOLING_MODES[enabled[0]], sentence_config.get("max_seq_length")
+
+
+class TextEmbeddingEncoder(abc.ABC):
+    # The embedder interface the pipeline uses, on top of embed_texts
+    def __init__(self, model_name):
+        self.model_name = model_name
+
+    @abc.abstractmethod
+    def embed_texts(self, texts):
+        pass
+
+    def embed_documents(self, elements):
+        vectors = self.embed_texts([get_element_text(element) for element in elements])
+        for element, vector in zip(elements, vectors):
+            set_element_embeddings(element, vector)
+        return elements
+
+    def embed_query(self, query):
+        return self.embed_texts([query])[0]
+
+
+class StaticEmbeddingEncoder(TextEmbeddingEncoder):
+    def initialize(self):
+        load_static_model(self.model_name)
+
+    @property
+    def num_of_dimensions(self):
+        return (load_static_model(self.model_name).dim,)
+
+    def embed_texts(self, texts):
+        # Not every static model normalizes its output; store unit vectors regardless
+        return normalize_embeddings(load_static_model(self.model_name).encode(texts)).tolist()
+
+
+class HuggingFaceEmbeddingEncoder(TextEmbeddingEncoder):
+    def __init__(self, model_name, pooling_mode, max_seq_length):
+        super().__init__(model_name)
+        self.pooling_mode = pooling_mode
+        self.max_seq_length = max_seq_length
+
+    def initialize(self):
+        load_huggingface_model(self.model_name)
+
+    @property
+    def num_of_dimensions(self):
+        return (load_huggingface_model(self.model_name)[1].config.hidden_size,)
+
+    def embed_texts(self, texts):
+        import torch
+
+        tokenizer = load_huggingface_model(self.model_name)[0]
+        # One tokenizer call for every chunk; padding happens per batch
+        encodings = tokenizer(texts, truncation=True, max_length=self.max_seq_length)
+        vectors = [None] * len(texts)
+        with torch.inference_mode():
+            for batch in self.pack_batches(texts):
+                out_of_memory = False
+                try:
+                    batch_vectors = self.encode_batch(encodings, batch)
+                except torch.cuda.OutOfMemoryError:
+                    out_of_memory = True
+                if out_of_memory:
+                    # Retry the offending batch one chunk at a time instead of
+                    # failing the job. This runs outside the except block, whose
+                    # traceback still holds the failed forward pass's tensors.
+                    print(f"Out of memory embedding a batch of {len(batch)} chunks; falling back to one at a time.")
+                    torch.cuda.empty_cache()
+                    batch_vectors = [self.encode_batch(encodings, [index])[0] for index in batch]
+                for index, vector in zip(batch, batch_vectors):
+                    vectors[index] = vector
+        return vectors
+
+    def pack_batches(self, texts):
+        # Longest first, so each batch holds chunks of similar length and needs
+        # little padding; a batch closes when either cap would be exceeded
+        batch, batch_characters = [], 0
+        for index in sorted(range(len(texts)), key=lambda index: len(texts[index]), reverse=True):
+            characters = len(texts[index])
+            if batch and (
+                len(batch) == HUGGINGFACE_BATCH_SIZE
+                or batch_characters + characters > HUGGINGFACE_BATCH_MAX_CHARACTERS
+            ):
+                yield batch
+                batch, batch_characters = [], 0
+            batch.append(index)
+            batch_characters += characters
+        if batch:
+            yield batch
+
+    def encode_batch(self, encodings, indices):
+        import torch
+
+        tokenizer, model = load_huggingface_model(self.model_name)
+        batch = tokenizer.pad(
+            {key: [values[index] for index in indices] for key, values in encodings.items()},
+            return_tensors="pt",
+        ).to(model.device)
+        # Upcast before pooling and normalizing to avoid bf16 accumulation error
+        hidden_state = model(**batch).last_hidden_state.float()
+        pooled = self.pool(hidden_state, batch["attention_mask"])
+        return torch.nn.functional.normalize(pooled, dim=-1).cpu().tolist()
+
+    def pool(self, hidden_state, attention_mask):
+        if self.pooling_mode == "cls":
+            return hidden_state[:, 0]
+        mask = attention_mask.unsqueeze(-1).to(hidden_state.dtype)
+        return (hidden_state * mask).sum(dim=1) / mask.sum(dim=1).clamp(min=1)
+
+
+class StaticEmbedderConfig(EmbedderConfig):
+    def get_embedder(self):
+        return StaticEmbeddingEncoder(self.embedding_model_name or DEFAULT_STATIC_MODEL_NAME)
+
+
+class HuggingFaceEmbedderConfig(EmbedderConfig):
+    def get_embedder(self):
+        sentence_transformers_config = load_sentence_transformers_config(self.embedding_model_name)
+        if sentence_transformers_config is None:
+            # Only the model's own modules reproduce its sentence embeddings
+            return super().get_embedder()
+        return HuggingFaceEmbeddingEncoder(self.embedding_model_name, *sentence_transformers_config)
+
+
+def build_embedder_config():
+    embedding_provider = os.getenv("EMBEDDING_PROVIDER")
+    if embedding_provider == STATIC_EMBEDDING_PROVIDER:
+        return StaticEmbedderConfig(embedding_model_name=os.getenv("EMBEDDING_MODEL_NAME"))
+    if embedding_provider == HUGGINGFACE_EMBEDDING_PROVIDER:
+        return HuggingFaceEmbedderConfig(
+            embedding_provider=embedding_provider,
+            embedding_model_name=os.getenv("EMBEDDING_MODEL_NAME"),
+        )
+    return EmbedderConfig(
+        embedding_provider=embedding_provider,
+        embedding_model_name=os.getenv("EMBEDDING_MODEL_NAME"),
+        embedding_api_key=os.getenv("EMBEDDING_PROVIDER_API_KEY"),
+    )
+
+
+def connect_postgres():
+    return psycopg2.connect(
+        dbname=os.getenv("POSTGRES_DB_NAME"),
+        user=os.getenv("POSTGRES_USER"),
+        password=os.getenv("POSTGRES_PASSWORD"),
+        host=os.getenv("POSTGRES_HOST"),
+        port=os.getenv("POSTGRES_PORT"),
+    )
+
+
+@functools.lru_cache(maxsize=None)
+def get_embedding_dimensions(table_name):
+    # pgvector keeps a column's declared width as its type modifier; -1 means
+    # the column accepts any width
+    connection = connect_postgres()
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT atttypmod FROM pg_attribute WHERE attrelid = %s::regclass AND attname = 'embeddings'",
+                (table_name,),
+            )
+            row = cursor.fetchone()
+            return row[0] if row and row[0] > 0 else None
+    finally:
+        connection.close()
+
+
+def check_embedding_dimensions(table_name, dimensions):
+    expected = get_embedding_dimensions(table_name)
+    if expected is not None and dimensions != expected:
+        raise ValueError(
+            f"The embedding model produces {dimensions}-dimensional vectors but "
+            f"{table_name}.embeddings holds {expected}. Declare the column with "
+            f"{dimensions} dimensions or choose a model that produces {expected}."
+        )
+
+
+def check_embedder_dimensions(embedder_config, table_name):
+    # Static models are cheap to load, so a model/column width mismatch is
+    # caught before any file is processed
+    if isinstance(embedder_config, StaticEmbedderConfig):
+        check_embedding_dimensions(table_name, embedder_config.get_embedder().num_of_dimensions[0])
+
+
+# Postgres upload. The stock stager rewrites every embedded element to a
+# second file and the stock uploader then INSERTs it one row per statement.
+# CopyPostgresUploader takes the embedder output directly, flattens each
+# element into the table's columns and streams the rows through a single
+# COPY ... FROM STDIN per transaction of COPY_BATCH_ROWS rows. Text format is used rather than binary: the ~40
+# metadata columns would each need their own binary encoder, while text input
+# is parsed by every column type, pgvector included.
+COPY_BATCH_ROWS = 10_000
+TIMESTAMP_TYPES = ("timestamp", "timestamptz", "date")
+# Elements report some integer columns as floats (e.g. pdfminer's page width
+# of 595.28). COPY parses them with the integer input function, which rejects
+# a fraction, so they are rounded here the way an INSERT would cast them.
+INTEGER_TYPES = ("int2", "int4", "int8")
+# Component precision of each pgvector type. A halfvec column stores 2-byte
+# floats, half the size of vector's and half the bandwidth for kNN scans, so
+# its values are written at float16 precision rather than as full doubles.
+VECTOR_TYPES = {"vector": np.float32, "halfvec": np.float16}
+
+
+@functools.lru_cache(maxsize=None)
+def get_table_column_types(table_name):
+    schema, _, table = table_name.rpartition(".")
+    connection = connect_postgres()
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT column_name, udt_name FROM information_schema.columns "
+                "WHERE table_name = %s AND table_schema = COALESCE(%s, current_schema()) "
+                "ORDER BY ordinal_position",
+                (table, schema or None),
+            )
+            return dict(cursor.fetchall())
+    finally:
+        connection.close()
+
+
+def element_to_row(element):
+    # Same flattening as the stock stager: metadata, its data source and its
+    # coordinates all become top-level columns
+    row = {key: value for key, value in element.items() if key != "metadata"}
+    metadata = dict(element.get("metadata") or {})
+    data_source = metadata.pop("data_source", None) or {}
+    coordinates = metadata.pop("coordinates", None) or {}
+    row.update(metadata)
+    row.update(data_source)
+    row.update(coordinates)
+    row["id"] = str(uuid.uuid4())
+    return row
+
+
+def parse_timestamp(value):
+    # Connectors report dates as epoch seconds (or milliseconds) or ISO strings
+    try:
+        seconds = float(value)
+    except (TypeError, ValueError):
+        return str(value)
+    if seconds > 1e11:
+        seconds /= 1000
+    return datetime.fromtimestamp(seconds, tz=timezone.utc).isoformat()
+
+
+def quote_array_item(item):
+    if item is None:
+        return "NULL"
+    # Nested values (e.g. the link dicts in metadata.links) go in as JSON
+    # rather than as their Python repr
+    if isinstance(item, (dict, list, tuple)):
+        item = json.dumps(item)
+    return '"' + str(item).replace("\\", "\\\\").replace('"', '\\"') + '"'
+
+
+def format_postgres_text(value, udt_name):
+    if udt_name in VECTOR_TYPES:
+        if isinstance(value, str):
+            return value
+        # pgvector rejects NaN and infinite components (numpy turns a None
+        # component into NaN), so float16 overflow past 65504 is caught too
+        with np.errstate(over="ignore"):
+            components = np.asarray(value, dtype=VECTOR_TYPES[udt_name])
+        if not np.isfinite(components).all():
+            raise ValueError("vector components must be finite")
+        return "[" + ",".join(str(component) for component in components) + "]"
+    if udt_name.startswith("_"):
+        items = value if isinstance(value, (list, tuple)) else [value]
+        return "{" + ",".join(quote_array_item(item) for item in items) + "}"
+    if udt_name in TIMESTAMP_TYPES:
+        return parse_timestamp(value)
+    if udt_name in INTEGER_TYPES:
+        return str(int(round(float(value))))
+    if isinstance(value, (dict, list, tuple)):
+        return json.dumps(value)
+    return str(value)
+
+
+def to_postgres_text(value, udt_name):
+    # Postgres' text input form for a value, parsed by the column's own type.
+    # A value that can't be converted (e.g. an infinite page width for an
+    # integer column) becomes NULL instead of failing the file.
+    if value is None:
+        return None
+    try:
+        return format_postgres_text(value, udt_name)
+    except (TypeError, ValueError, OverflowError) as error:
+        print(f"Writing NULL for {value!r:.100}, which is not a valid {udt_name}: {error}")
+        return None
+
+
+def escape_copy_text(value):
+    if value is None:
+        return "\\N"
+    return value.replace("\\", "\\\\").replace("\t", "\\t").replace("\n", "\\n").replace("\r", "\\r")
+
+
+class CopyStream:
+    # File-like reader over formatted rows, so COPY consumes them as they are
+    # produced rather than from a fully built buffer
+    def __init__(self, rows):
+        self.lines = ("\t".join(escape_copy_text(value) for value in row) + "\n" for row in rows)
+        self.buffer = ""
+
+    def read(self, size=-1):
+        while size < 0 or len(self.buffer) < size:
+            line = next(self.lines, None)
+            if line is None:
+                break
+            self.buffer += line
+        if size < 0:
+            size = len(self.buffer)
+        chunk, self.buffer = self.buffer[:size], self.buffer[size:]
+        return chunk
+
+
+def read_elements(path):
+    with open(path) as elements_file:
+        contents = elements_file.read()
+    try:
+        return json.loads(contents)
+    except json.JSONDecodeError:
+        return [json.loads(line) for line in contents.splitlines() if line.strip()]
+
+
+class CopyPostgresUploader(PostgresUploader):
+    def run(self, path, file_data=None, **kwargs):
+        table_name = self.upload_config.table_name
+        column_types = get_table_column_types(table_name)
+        rows = [element_to_row(element) for element in read_elements(path)]
+        if not rows:
+            return
+        # Every provider is checked here, on the first vector, since only
+        # static models are loaded before the pipeline runs
+        embeddings = next((row["embeddings"] for row in rows if row.get("embeddings")), None)
+        if embeddings is not None and not isinstance(embeddings, str):
+            check_embedding_dimensions(table_name, len(embeddings))
+        columns = [column for column in column_types if any(column in row for row in rows)]
+        table_identifier = psycopg2.sql.Identifier(*table_name.split("."))
+        column_list = psycopg2.sql.SQL(", ").join(map(psycopg2.sql.Identifier, columns))
+
+        def format_rows(batch):
+            for row in batch:
+                yield [to_postgres_text(row.get(column), column_types[column]) for column in columns]
+
+        def insert_rows(cursor, batch):
+            insert_sql = psycopg2.sql.SQL("INSERT INTO {} ({}) VALUES ({})").format(
+                table_identifier,
+                column_list,
+                psycopg2.sql.SQL(", ").join([psycopg2.sql.Placeholder()] * len(columns)),
+            )
+            skipped = 0
+            for row, values in zip(batch, format_rows(batch)):
+                # A savepoint per row keeps a rejected row from aborting the
+                # rest of the transaction
+                cursor.execute("SAVEPOINT insert_row")
+                try:
+                    cursor.execute(insert_sql, values)
+                except psycopg2.DataError as error:
+                    cursor.execute("ROLLBACK TO SAVEPOINT insert_row")
+                    skipped += 1
+                    print(f"Skipping element {row.get('element_id')}: {error}")
+                cursor.execute("RELEASE SAVEPOINT insert_row")
+            if skipped:
+                print(f"Skipped {skipped} of {len(batch)} row(s) rejected by {table_name}.")
+
+        connection = connect_postgres()
+        try:
+            for start in range(0, len(rows), COPY_BATCH_ROWS):
+                batch = rows[start:start + COPY_BATCH_ROWS]
+                # Each batch is its own transaction
+                with connection, connection.cursor() as cursor:
+                    try:
+                        cursor.copy_expert(
+                            psycopg2.sql.SQL("COPY {} ({}) FROM STDIN")
+                            .format(table_identifier, column_list)
+                            .as_string(connection),
+                            CopyStream(format_rows(batch)),
+                        )
+                    except psycopg2.DataError as error:
+                        # One bad value fails the whole COPY. Insert the batch
+                        # row by row instead, so only the rows Postgres rejects
+                        # are skipped.
+                        print(f"COPY into {table_name} failed ({error}); inserting the batch row by row.")
+                        connection.rollback()
+                        insert_rows(cursor, batch)
+        finally:
+            connection.close()
@@ -1,61 +1,74 @@
 import json
+import logging
 import os
 import boto3
-import botocore
 import uuid
-import urllib
-import psycopg2
-import time
-
-# Initialize the Batch client and S3 client
-batch_client = boto3.client('batch')
-s3_client = boto3.client('s3')
-
-# Read the app.py script from the Lambda's local file system
-with open('s3_postgres_ingest.py', 'r') as script_file:
-    app_script = script_file.read()
-
-
-def delete_from_postgres(db_name, user, password, host, port, table_name, filename):
-    start_time = time.time()
-    connection = None
-    try:
-        # Connect to the PostgreSQL database
-        connection = psycopg2.connect(
-            dbname=db_name,
-            user=user,
-            password=password,
-            host=host,
-            port=port,
-        )
-        cursor = connection.cursor()
-        
-        delete_query = f"DELETE FROM {table_name} WHERE filename = %s"
-        print(f"Executing query: {delete_query} with filename: {filename}")
-        
-        cursor.execute(delete_query, (filename,))
-        
-        connection.commit()
-        
-        print(f"{cursor.rowcount} record(s) deleted.")
-    
-    except (Exception, psycopg2.DatabaseError) as error:
-        print("Error while deleting records from Postgres: %s", error)
-    
-    finally:
-        if cursor:
-            cursor.close()
-        if connection:
-            connection.close()
-
-    end_time = time.time()
-    elapsed_time = end_time - start_time
-    print(f"Process took {elapsed_time:.2f} seconds.")
-    
+import urllib.parse
+from botocore.config import Config
+from concurrent.futures import ThreadPoolExecutor
+
+from postgres_utils import DEBUG, delete_from_postgres, drop_embedding_index, embedding_index_name
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.DEBUG if DEBUG else logging.INFO)
+
+# Upper bound on concurrent submit_job calls when starting several Batch jobs
+MAX_SUBMIT_WORKERS = 32
+
+# Keep enough pooled HTTPS connections for the concurrent submit_job fan-out
+# and reuse them across warm invocations
+boto_config = Config(
+    max_pool_connections=64,
+    retries={'mode': 'adaptive', 'max_attempts': 5},
+    tcp_keepalive=True,
+)
+
+# Initialize the Batch client and S3 client from one shared session
+session = boto3.session.Session()
+batch_client = session.client('batch', config=boto_config)
+s3_client = session.client('s3', config=boto_config)
+
+# Environment variables, read once per Lambda container
+job_queue = os.environ['JOB_QUEUE']
+job_definition = os.environ['JOB_DEFINITION']
+index_job_definition = os.environ['INDEX_JOB_DEFINITION']
+s3_bucket_name = os.environ['S3_BUCKET_NAME']
+s3_notification_prefix = os.environ.get('S3_NOTIFICATION_PREFIX', '')
+local_file_download_dir = '/tmp/'  # Temporary directory for Lambda file storage
+
+# Container environment shared by every Batch job; only AWS_S3_URL varies per job
+static_job_environment = (
+    {'name': 'AWS_ACCESS_KEY_ID', 'value': os.environ['MY_AWS_ACCESS_KEY_ID']},
+    {'name': 'AWS_SECRET_ACCESS_KEY', 'value': os.environ['MY_AWS_SECRET_ACCESS_KEY']},
+    {'name': 'POSTGRES_DB_NAME', 'value': os.environ['POSTGRES_DB_NAME']},
+    {'name': 'POSTGRES_USER', 'value': os.environ['POSTGRES_USER']},
+    {'name': 'POSTGRES_PASSWORD', 'value': os.environ['POSTGRES_PASSWORD']},
+    {'name': 'POSTGRES_HOST', 'value': os.environ['POSTGRES_HOST']},
+    {'name': 'POSTGRES_PORT', 'value': os.environ['POSTGRES_PORT']},
+    {'name': 'POSTGRES_TABLE_NAME', 'value': os.environ['POSTGRES_TABLE_NAME']},
+    {'name': 'EMBEDDING_PROVIDER', 'value': os.environ['EMBEDDING_PROVIDER']},
+    {'name': 'EMBEDDING_MODEL_NAME', 'value': os.environ['EMBEDDING_MODEL_NAME']},
+    {'name': 'EMBEDDING_PROVIDER_API_KEY', 'value': os.environ['EMBEDDING_PROVIDER_API_KEY']},
+    {'name': 'CHUNKING_STRATEGY', 'value': os.environ['CHUNKING_STRATEGY']},
+    {'name': 'CHUNKING_MAX_CHARACTERS', 'value': os.environ['CHUNKING_MAX_CHARACTERS']},
+    {'name': 'INGEST_NUM_PROCESSES', 'value': os.environ.get('INGEST_NUM_PROCESSES', '')},
+    {'name': 'EMBEDDING_BATCH_SIZE', 'value': os.environ.get('EMBEDDING_BATCH_SIZE', '')},
+    {'name': 'EMBEDDING_TORCH_DTYPE', 'value': os.environ.get('EMBEDDING_TORCH_DTYPE', '')},
+    {'name': 'LOCAL_FILE_DOWNLOAD_DIR', 'value': local_file_download_dir},
+)
+
+# Container environment of the job that rebuilds the embeddings index
+index_job_environment = (
+    *(variable for variable in static_job_environment if variable['name'].startswith('POSTGRES_')),
+    {'name': 'JOB_QUEUE', 'value': job_queue},
+    {'name': 'EMBEDDING_INDEX_NAME', 'value': embedding_index_name},
+)
+
+
 def lambda_handler(event, context):
     # Check if this is a delete event (ie. CDK delete)
     if event.get('RequestType') == 'Delete':
-        print("Stack is being deleted, no Batch job will be started.")
+        logger.info("Stack is being deleted, no Batch job will be started.")
         return {
             'statusCode': 200,
             'body': json.dumps("Delete event - no action taken.")
@@ -64,111 +77,131 @@ def lambda_handler(event, context):
     # Check if it's an S3 event or a custom resource event
     if 'Records' in event and event['Records']:
         # Handle S3 event
-        print("S3 event received. Determining if object is new or needs to be updated.")
-        bucket_name = event['Records'][0]['s3']['bucket']['name']
-        document_key = event['Records'][0]['s3']['object']['key']
-        
-        decoded_document_key = urllib.parse.unquote(document_key)
-        decoded_document_with_spaces = decoded_document_key.replace('+', ' ').replace('%20', ' ')
-        s3_url = f"s3://{bucket_name}/{decoded_document_with_spaces}"
-
-        if does_object_exist(bucket_name, decoded_document_with_spaces):
-            print(f"Object {decoded_document_with_spaces} already exists. Deleting vectors from database.")
-            # Retrieve the Postgres info from environment variables
-            db_name = os.environ['POSTGRES_DB_NAME']
-            user = os.environ['POSTGRES_USER']
-            password = os.environ['POSTGRES_PASSWORD']
-            host = os.environ['POSTGRES_HOST']
-            port = os.environ['POSTGRES_PORT']
-            table_name = os.environ['POSTGRES_TABLE_NAME']
+        logger.info("S3 event received. Determining if object is new or needs to be updated.")
+        s3_urls = []
+        existing_filenames = []
+        for record in event['Records']:
+            bucket_name = record['s3']['bucket']['name']
+            document_key = record['s3']['object']['key']
+
+            # S3 event keys are form-encoded: spaces arrive as '+'
+            decoded_document_key = urllib.parse.unquote_plus(document_key)
+            s3_urls.append(f"s3://{bucket_name}/{decoded_document_key}")
+
+            # The event itself says the object was written, so there is no need
+            # for a HEAD request. Any write may be an overwrite; deleting a file
+            # that has no rows yet is a no-op.
+            if record['eventName'].startswith('ObjectCreated'):
+                logger.debug("Object %s written. Deleting any existing vectors from database.", decoded_document_key)
+                existing_filenames.append(os.path.basename(decoded_document_key))
+
+        # Remove stale vectors for every updated object in one round trip
+        if existing_filenames:
+            # A failure here fails the invocation before any job is started, so
+            # the retried event doesn't ingest on top of stale rows
             try:
-                delete_from_postgres(db_name, user, password, host, port, table_name, os.path.basename(decoded_document_with_spaces))
+                delete_from_postgres(existing_filenames)
             except Exception as e:
-                print(f"Error deleting from Postgres: {e}")
+                logger.error("Error deleting from Postgres: %s", e)
+                raise
 
-        return add_files(s3_url)
+        if len(s3_urls) == 1:
+            return add_files(s3_urls[0])
+
+        submit_batch_jobs(s3_urls)
+
+        return {
+            'statusCode': 200,
+            'body': json.dumps(f"Started {len(s3_urls)} Batch Jobs.")
+        }
 
     else:
         # Handle custom resource event (initial processing)
-        print("Custom resource event received. Listing objects in S3 bucket.")
-        bucket_name = os.environ['S3_BUCKET_NAME']
-        prefix = os.environ.get('S3_NOTIFICATION_PREFIX', '')
-        
-        # List existing objects in the bucket
-        response = s3_client.list_objects_v2(Bucket=bucket_name, Prefix=prefix)
-        
-        if 'Contents' in response:
-            for item in response['Contents']:
-                document_key = item['Key']
-                s3_url = f"s3://{bucket_name}/{document_key}"
-
-                # Skip the object if its size is 0 (indicating it's a folder)
-                if item['Size'] == 0:
-                    print(f"Skipping folder: {document_key}")
-                    continue
-                
-                add_files(s3_url)
-        else:
-            print("No objects found in the bucket.")
+        logger.info("Custom resource event received. Listing objects in S3 bucket.")
+        # Drop the embeddings index for the bulk load so each insert doesn't pay
+        # for index maintenance; the index job rebuilds it afterwards
+        try:
+            drop_embedding_index()
+        except Exception as e:
+            logger.error("Error dropping embeddings index: %s", e)
+
+        # The bulk load's jobs share a name prefix, by which the index job
+        # finds them
+        bulk_load_job_prefix = f"BulkLoad_{uuid.uuid4()}_"
+
+        # List existing objects in the bucket page by page, so buckets with
+        # more than 1000 keys are fully processed without holding every key
+        paginator = s3_client.get_paginator('list_objects_v2')
+        pages = paginator.paginate(
+            Bucket=s3_bucket_name,
+            Prefix=s3_notification_prefix,
+            PaginationConfig={'PageSize': 1000},
+        )
+
+        submitted = 0
+        for page in pages:
+            s3_urls = [
+                f"s3://{s3_bucket_name}/{item['Key']}"
+                for item in iter_files(page.get('Contents', []))
+            ]
+            if s3_urls:
+                submit_batch_jobs(s3_urls, bulk_load_job_prefix)
+                submitted += len(s3_urls)
+
+        if not submitted:
+            logger.info("No objects found in the bucket.")
+
+        # Submitted with no dependencies: the index job waits for the bulk
+        # load's jobs itself and rebuilds the index whether or not they all
+        # succeed
+        index_job_id = submit_index_job(bulk_load_job_prefix)
+        logger.info("Embeddings index will be rebuilt by Batch Job: %s", index_job_id)
 
         return {
             'statusCode': 200,
             'body': json.dumps("Processed existing items.")
         }
 
-def does_object_exist(bucket_name, document_key):
-    try:
-        s3_client.head_object(Bucket=bucket_name, Key=document_key)
-        return True
-    except botocore.exceptions.ClientError as e:
-        if e.response['Error']['Code'] == '404':
-            return False
-        else:
-            raise
-
-def add_files(s3_url):  
-    # Environment variables 
-    aws_access_key = os.environ['MY_AWS_ACCESS_KEY_ID']
-    aws_secret_key = os.environ['MY_AWS_SECRET_ACCESS_KEY']
-    db_name = os.environ['POSTGRES_DB_NAME']
-    user = os.environ['POSTGRES_USER']
-    password = os.environ['POSTGRES_PASSWORD']
-    host = os.environ['POSTGRES_HOST']
-    port = os.environ['POSTGRES_PORT']
-    table_name = os.environ['POSTGRES_TABLE_NAME']
-    embedding_provider = os.environ['EMBEDDING_PROVIDER']
-    embedding_model_name = os.environ['EMBEDDING_MODEL_NAME']
-    embedding_provider_api_key = os.environ['EMBEDDING_PROVIDER_API_KEY']
-    chunking_strategy = os.environ['CHUNKING_STRATEGY']
-    chunking_max_characters = os.environ['CHUNKING_MAX_CHARACTERS']
-    local_file_download_dir = '/tmp/'  # Temporary directory for Lambda file storage
+def iter_files(contents):
+    for item in contents:
+        # Skip the object if its size is 0 (indicating it's a folder)
+        if item['Size'] == 0:
+            logger.debug("Skipping folder: %s", item['Key'])
+            continue
+        yield item
+
+def submit_batch_jobs(s3_urls, job_name_prefix='BatchJob_'):
+    # Each submit_job call is independent and network-bound, so issue them concurrently
+    with ThreadPoolExecutor(max_workers=MAX_SUBMIT_WORKERS) as executor:
+        return list(executor.map(lambda s3_url: add_files(s3_url, job_name_prefix), s3_urls))
+
+def submit_index_job(bulk_load_job_prefix):
+    response = batch_client.submit_job(
+        jobName=f"IndexJob_{uuid.uuid4()}",
+        jobQueue=job_queue,
+        jobDefinition=index_job_definition,
+        containerOverrides={
+            'environment': [
+                {'name': 'BULK_LOAD_JOB_PREFIX', 'value': bulk_load_job_prefix},
+                *index_job_environment,
+            ],
+        },
+    )
+    return response['jobId']
 
+def add_files(s3_url, job_name_prefix='BatchJob_'):
     # Generate a valid job name
-    job_name = f"BatchJob_{uuid.uuid4()}"
+    job_name = f"{job_name_prefix}{uuid.uuid4()}"
 
     # Start Batch job
     response = batch_client.submit_job(
         jobName=job_name,
-        jobQueue=os.environ['JOB_QUEUE'],  # Job queue from environment variables
-        jobDefinition=os.environ['JOB_DEFINITION'],  # Job definition from environment variables
+        jobQueue=job_queue,
+        jobDefinition=job_definition,
         containerOverrides={
             'environment': [
                 {'name': 'AWS_S3_URL', 'value': s3_url},
-                {'name': 'AWS_ACCESS_KEY_ID', 'value': aws_access_key},
-                {'name': 'AWS_SECRET_ACCESS_KEY', 'value': aws_secret_key},
-                {'name': 'POSTGRES_DB_NAME', 'value': db_name},
-                {'name': 'POSTGRES_USER', 'value': user},
-                {'name': 'POSTGRES_PASSWORD', 'value': password},
-                {'name': 'POSTGRES_HOST', 'value': host},
-                {'name': 'POSTGRES_PORT', 'value': port},
-                {'name': 'POSTGRES_TABLE_NAME', 'value': table_name},
-                {'name': 'EMBEDDING_PROVIDER', 'value': embedding_provider},
-                {'name': 'EMBEDDING_MODEL_NAME', 'value': embedding_model_name},
-                {'name': 'EMBEDDING_PROVIDER_API_KEY', 'value': embedding_provider_api_key},
-                {'name': 'CHUNKING_STRATEGY', 'value': chunking_strategy},
-                {'name': 'CHUNKING_MAX_CHARACTERS', 'value': chunking_max_characters},
-                {'name': 'LOCAL_FILE_DOWNLOAD_DIR', 'value': local_file_download_dir},
-                {'name': 'APP_SCRIPT', 'value': app_script},
+                *static_job_environment,
             ],
         },
     )
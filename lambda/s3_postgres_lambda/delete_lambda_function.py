@@ -1,67 +1,34 @@
 # lambda/s3_postgres_lambda/delete_lambda_function.py
 import json
+import logging
 import os
 import urllib.parse
-import psycopg2
-import time
 
-def delete_from_postgres(db_name, user, password, host, port, table_name, filename):
-    start_time = time.time()
-    connection = None
-    try:
-        # Connect to the PostgreSQL database
-        connection = psycopg2.connect(
-            dbname=db_name,
-            user=user,
-            password=password,
-            host=host,
-            port=port,
-        )
-        cursor = connection.cursor()
-        
-        delete_query = f"DELETE FROM {table_name} WHERE filename = %s"
-        print(f"Executing query: {delete_query} with filename: {filename}")
-        
-        cursor.execute(delete_query, (filename,))
-        
-        connection.commit()
-        
-        print(f"{cursor.rowcount} record(s) deleted.")
-    
-    except (Exception, psycopg2.DatabaseError) as error:
-        print("Error while deleting records from Postgres: %s", error)
-    
-    finally:
-        if cursor:
-            cursor.close()
-        if connection:
-            connection.close()
+from postgres_utils import DEBUG, delete_from_postgres
 
-    end_time = time.time()
-    elapsed_time = end_time - start_time
-    print(f"Process took {elapsed_time:.2f} seconds.")
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.DEBUG if DEBUG else logging.INFO)
 
 def lambda_handler(event, context):
-    db_name = os.environ['POSTGRES_DB_NAME']
-    user = os.environ['POSTGRES_USER']
-    password = os.environ['POSTGRES_PASSWORD']
-    host = os.environ['POSTGRES_HOST']
-    port = os.environ['POSTGRES_PORT']
-    table_name = os.environ['POSTGRES_TABLE_NAME']
-
+    filenames = []
     for record in event['Records']:
         s3_bucket = record['s3']['bucket']['name']
         s3_key = record['s3']['object']['key']
 
-        filename = os.path.basename(s3_key)
+        # S3 event keys are form-encoded: spaces arrive as '+'
+        decoded_filename = urllib.parse.unquote_plus(os.path.basename(s3_key))
+        filenames.append(decoded_filename)
+        logger.debug("Deleting File: %s from Bucket: %s", decoded_filename, s3_bucket)
 
-        try:
-            decoded_filename = urllib.parse.unquote(filename)
-            decoded_filename_with_spaces = decoded_filename.replace('+', ' ').replace('%20', ' ')
-            delete_from_postgres(db_name, user, password, host, port, table_name, decoded_filename_with_spaces)
-            print(f"Deleted File: {decoded_filename_with_spaces} from Bucket: {s3_bucket}")
-        except Exception as e:
-            print(f"Error deleting from Postgres: {e}")
+    # Delete the vectors of every removed object in a single statement
+    try:
+        delete_from_postgres(filenames)
+        logger.info("Deleted %s file(s) from PostgreSQL.", len(filenames))
+    except Exception as e:
+        # Fail the invocation so the event is retried rather than leaving the
+        # vectors of deleted files behind
+        logger.error("Error deleting from Postgres: %s", e)
+        raise
 
     return {
         'statusCode': 200,
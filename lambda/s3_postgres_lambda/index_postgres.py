@@ -0,0 +1,103 @@
+import os
+import time
+from collections import Counter
+
+import botocore.session
+import psycopg2
+
+# Builds the vector index on the embeddings column after the initial bulk
+# load. add_lambda_function.py drops the index before fanning out the ingest
+# jobs, names them all with BULK_LOAD_JOB_PREFIX and then submits this script
+# as a job of its own. It waits until none of those jobs is left to run and
+# builds the index once over the loaded table, instead of it being maintained
+# row by row during the load. Failed ingest jobs don't hold the index back.
+
+# HNSW build parameters
+HNSW_M = 16
+HNSW_EF_CONSTRUCTION = 64
+
+# Cosine distance operator class for each pgvector column type
+OPERATOR_CLASSES = {"vector": "vector_cosine_ops", "halfvec": "halfvec_cosine_ops"}
+
+# Batch job statuses before a job succeeds or fails
+ACTIVE_JOB_STATUSES = ("SUBMITTED", "PENDING", "RUNNABLE", "STARTING", "RUNNING")
+POLL_SECONDS = 60
+
+
+def count_job_statuses(batch_client, job_queue, job_name_prefix):
+    # With a filter, ListJobs returns the matching jobs in every status
+    paginator = batch_client.get_paginator("list_jobs")
+    pages = paginator.paginate(
+        jobQueue=job_queue,
+        filters=[{"name": "JOB_NAME", "values": [f"{job_name_prefix}*"]}],
+    )
+    statuses = Counter()
+    for page in pages:
+        statuses.update(job["status"] for job in page["jobSummaryList"])
+    return statuses
+
+
+def wait_for_jobs(batch_client, job_queue, job_name_prefix, poll_seconds=POLL_SECONDS):
+    while True:
+        statuses = count_job_statuses(batch_client, job_queue, job_name_prefix)
+        active = sum(statuses[status] for status in ACTIVE_JOB_STATUSES)
+        if not active:
+            return statuses
+        print(f"Waiting for {active} bulk load job(s) to finish.")
+        time.sleep(poll_seconds)
+
+
+def get_operator_class(cursor, table_name):
+    schema, _, table = table_name.rpartition(".")
+    cursor.execute(
+        "SELECT udt_name FROM information_schema.columns "
+        "WHERE table_name = %s AND table_schema = COALESCE(%s, current_schema()) "
+        "AND column_name = 'embeddings'",
+        (table, schema or None),
+    )
+    row = cursor.fetchone()
+    if row is None:
+        raise ValueError(f"{table_name} has no embeddings column to build the vector index on.")
+    if row[0] not in OPERATOR_CLASSES:
+        raise ValueError(
+            f"{table_name}.embeddings is of type {row[0]}, but the vector index "
+            f"needs a vector or halfvec column."
+        )
+    return OPERATOR_CLASSES[row[0]]
+
+
+if __name__ == "__main__":
+    table_name = os.getenv("POSTGRES_TABLE_NAME")
+    index_name = os.getenv("EMBEDDING_INDEX_NAME")
+
+    # APP_SCRIPT_S3_REGION is the stack's region, which the job queue is in
+    batch_client = botocore.session.get_session().create_client(
+        "batch", region_name=os.environ["APP_SCRIPT_S3_REGION"]
+    )
+    statuses = wait_for_jobs(batch_client, os.getenv("JOB_QUEUE"), os.getenv("BULK_LOAD_JOB_PREFIX"))
+    print(f"Bulk load finished: {statuses['SUCCEEDED']} job(s) succeeded, {statuses['FAILED']} failed.")
+
+    connection = psycopg2.connect(
+        dbname=os.getenv("POSTGRES_DB_NAME"),
+        user=os.getenv("POSTGRES_USER"),
+        password=os.getenv("POSTGRES_PASSWORD"),
+        host=os.getenv("POSTGRES_HOST"),
+        port=os.getenv("POSTGRES_PORT"),
+    )
+    try:
+        with connection, connection.cursor() as cursor:
+            operator_class = get_operator_class(cursor, table_name)
+
+            started = time.perf_counter()
+            cursor.execute(
+                f"CREATE INDEX IF NOT EXISTS {index_name} ON {table_name} "
+                f"USING hnsw (embeddings {operator_class}) "
+                f"WITH (m = {HNSW_M}, ef_construction = {HNSW_EF_CONSTRUCTION})"
+            )
+            cursor.execute(f"ANALYZE {table_name}")
+            elapsed_ms = (time.perf_counter() - started) * 1000
+
+        # Batch ships stdout to CloudWatch Logs
+        print(f"Built index {index_name} on {table_name} in {elapsed_ms:.0f} ms.")
+    finally:
+        connection.close()
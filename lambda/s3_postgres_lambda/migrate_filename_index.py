@@ -0,0 +1,49 @@
+# lambda/s3_postgres_lambda/migrate_filename_index.py
+
+# One-off migration that adds the filename index to a table created before
+# the CLI's SQL included it. Run it once, from anywhere that can reach the
+# database, with the same POSTGRES_* environment variables as the Lambdas:
+#
+#     python lambda/s3_postgres_lambda/migrate_filename_index.py
+#
+# CONCURRENTLY builds the index without blocking ingestion or deletes. It
+# cannot run inside a transaction block, so the connection is in autocommit.
+
+import psycopg2
+
+from postgres_utils import (
+    db_name,
+    filename_index_name,
+    host,
+    password,
+    port,
+    qualify_index_name,
+    table_name,
+    user,
+)
+
+
+if __name__ == "__main__":
+    qualified_index_name = qualify_index_name(filename_index_name)
+
+    connection = psycopg2.connect(dbname=db_name, user=user, password=password, host=host, port=port)
+    connection.autocommit = True
+    try:
+        with connection.cursor() as cursor:
+            # An interrupted concurrent build leaves an invalid index behind,
+            # which IF NOT EXISTS would accept as done
+            cursor.execute(
+                "SELECT NOT indisvalid FROM pg_index WHERE indexrelid = to_regclass(%s)",
+                (qualified_index_name,),
+            )
+            row = cursor.fetchone()
+            if row and row[0]:
+                print(f"Dropping invalid index {qualified_index_name} left by an earlier build.")
+                cursor.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {qualified_index_name}")
+
+            cursor.execute(
+                f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {filename_index_name} ON {table_name} (filename)"
+            )
+        print(f"Index {qualified_index_name} on {table_name} is ready.")
+    finally:
+        connection.close()
@@ -1,40 +1,152 @@
 # lambda/s3_postgres_lambda/postgres_utils.py
 
-import psycopg2
+import atexit
+import logging
+import os
 import time
 
-def delete_from_postgres(db_name, user, password, host, port, table_name, filename):
-    start_time = time.time()
-    connection = None
-    try:
-        # Connect to the PostgreSQL database
-        connection = psycopg2.connect(
+import psycopg2
+import psycopg2.extensions
+import psycopg2.pool
+
+# Per-statement diagnostics are only logged with DEBUG=1; under a burst of S3
+# events they would otherwise add a CloudWatch write per call
+DEBUG = os.getenv('DEBUG') == '1'
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.DEBUG if DEBUG else logging.INFO)
+
+# Postgres connection settings, read once per Lambda container
+db_name = os.environ['POSTGRES_DB_NAME']
+user = os.environ['POSTGRES_USER']
+password = os.environ['POSTGRES_PASSWORD']
+host = os.environ['POSTGRES_HOST']
+port = os.environ['POSTGRES_PORT']
+table_name = os.environ['POSTGRES_TABLE_NAME']
+
+class PooledConnection(psycopg2.extensions.connection):
+    # Prepared statements live for the whole session, so each pooled
+    # connection only has to PREPARE the delete once
+    delete_prepared = False
+
+
+# Connection pool shared by every invocation a warm container serves. It is
+# created on first use so that events which never touch Postgres (e.g. CDK
+# delete events) don't pay for a connection.
+pg_pool = None
+
+
+def get_pool():
+    global pg_pool
+    if pg_pool is None:
+        pg_pool = psycopg2.pool.SimpleConnectionPool(
+            1,
+            4,
             dbname=db_name,
             user=user,
             password=password,
             host=host,
             port=port,
+            keepalives=1,
+            keepalives_idle=30,
+            keepalives_interval=10,
+            keepalives_count=3,
+            connection_factory=PooledConnection,
         )
-        cursor = connection.cursor()
-        
-        delete_query = f"DELETE FROM {table_name} WHERE filename = %s"
-        print(f"Executing query: {delete_query} with filename: {filename}")
-        
-        cursor.execute(delete_query, (filename,))
-        
+    return pg_pool
+
+
+def close_pool():
+    if pg_pool is not None:
+        pg_pool.closeall()
+
+
+atexit.register(close_pool)
+
+
+# Attempts for a delete whose connection was dropped or broken, e.g. a pooled
+# connection the server closed while the container was frozen
+DELETE_ATTEMPTS = 3
+
+
+# Index on the filename column, which updates and deletes filter on. Index
+# names are unqualified; an index always lives in its table's schema.
+filename_index_name = f"ix_{table_name.split('.')[-1]}_filename"
+
+
+def qualify_index_name(index_name):
+    schema = table_name.rpartition('.')[0]
+    return f"{schema}.{index_name}" if schema else index_name
+
+
+# HNSW index on the embeddings column. The initial bulk load drops it and
+# index_postgres.py rebuilds it once the ingest jobs have finished.
+embedding_index_name = f"ix_{table_name.split('.')[-1]}_embeddings"
+
+
+def drop_embedding_index():
+    pool = get_pool()
+    connection = pool.getconn()
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute(f"DROP INDEX IF EXISTS {qualify_index_name(embedding_index_name)}")
         connection.commit()
-        
-        print(f"{cursor.rowcount} record(s) deleted.")
-    
-    except (Exception, psycopg2.DatabaseError) as error:
-        print("Error while deleting records from Postgres: %s", error)
-    
+    except Exception:
+        if not connection.closed:
+            connection.rollback()
+        raise
     finally:
-        if cursor:
-            cursor.close()
-        if connection:
-            connection.close()
-
-    end_time = time.time()
-    elapsed_time = end_time - start_time
-    print(f"Process took {elapsed_time:.2f} seconds.")
+        pool.putconn(connection, close=bool(connection.closed))
+
+
+def delete_from_postgres(filenames):
+    for attempt in range(DELETE_ATTEMPTS):
+        pool = connection = None
+        try:
+            # Opening a connection can fail transiently too (e.g. refused
+            # during a failover), so it is retried along with the statement
+            pool = get_pool()
+            connection = pool.getconn()
+
+            with connection.cursor() as cursor:
+                # A single statement removes the vectors of every file in the batch.
+                # It is parsed and planned once per connection, then only executed.
+                if not connection.delete_prepared:
+                    cursor.execute(
+                        f"PREPARE delete_by_filenames (text[]) AS DELETE FROM {table_name} WHERE filename = ANY($1)"
+                    )
+                    # Prepared statements are session-scoped and survive a
+                    # ROLLBACK, so mark it as soon as it exists
+                    connection.delete_prepared = True
+                logger.debug("Deleting records from %s with filenames: %s", table_name, filenames)
+
+                cursor.execute("EXECUTE delete_by_filenames (%s)", (list(filenames),))
+
+                connection.commit()
+
+                logger.debug("%s record(s) deleted.", cursor.rowcount)
+            return
+
+        except (psycopg2.OperationalError, psycopg2.InterfaceError) as error:
+            # The session is unusable; discard it and retry on a fresh connection
+            if connection is not None:
+                pool.putconn(connection, close=True)
+                connection = None
+            logger.warning(
+                "Transient error deleting from Postgres (attempt %s of %s): %s",
+                attempt + 1, DELETE_ATTEMPTS, error,
+            )
+            if attempt == DELETE_ATTEMPTS - 1:
+                raise
+            time.sleep(0.1 * 2 ** attempt)
+
+        except Exception:
+            # Anything else is not going to succeed on retry; surface it so the
+            # invocation fails and Lambda retries the event
+            if connection is not None and not connection.closed:
+                connection.rollback()
+            raise
+
+        finally:
+            if connection is not None:
+                pool.putconn(connection, close=bool(connection.closed))
@@ -9,11 +9,11 @@ from unstructured_ingest.v2.processes.connectors.sql.postgres import (
     PostgresConnectionConfig,
     PostgresAccessConfig,
     PostgresUploaderConfig,
-    PostgresUploadStagerConfig
 )
 from unstructured_ingest.v2.processes.partitioner import PartitionerConfig
 from unstructured_ingest.v2.processes.chunker import ChunkerConfig
-from unstructured_ingest.v2.processes.embedder import EmbedderConfig
+
+from postgres_ingest_utils import CopyPostgresUploader, build_embedder_config, check_embedder_dimensions
 
 if __name__ == "__main__":
     metadata_includes = [
@@ -29,7 +29,12 @@ if __name__ == "__main__":
 
     # Prepare the configuration dictionary
     pipeline_configs = {
-        "context": ProcessorConfig(),
+        # Files are downloaded, partitioned and embedded by a pool of worker
+        # processes. Each one loads its own embedding model, so it stays at
+        # ProcessorConfig's default of 2 unless INGEST_NUM_PROCESSES says otherwise.
+        "context": ProcessorConfig(
+            num_processes=int(os.getenv("INGEST_NUM_PROCESSES") or 2),
+        ),
         "indexer_config": S3IndexerConfig(remote_url=os.getenv("AWS_S3_URL")),
         "downloader_config": S3DownloaderConfig(download_dir=os.getenv("LOCAL_FILE_DOWNLOAD_DIR")),
         "source_connection_config": S3ConnectionConfig(
@@ -42,11 +47,7 @@ if __name__ == "__main__":
             partition_by_api=False,
             strategy="auto",
         ),
-        "embedder_config": EmbedderConfig(
-            embedding_provider=os.getenv("EMBEDDING_PROVIDER"),
-            embedding_model_name=os.getenv("EMBEDDING_MODEL_NAME"),
-            embedding_api_key=os.getenv("EMBEDDING_PROVIDER_API_KEY"),
-        ),
+        "embedder_config": build_embedder_config(),
         "destination_connection_config": PostgresConnectionConfig(
             access_config=PostgresAccessConfig(password=os.getenv("POSTGRES_PASSWORD")),
             host=os.getenv("POSTGRES_HOST"),
@@ -54,7 +55,6 @@ if __name__ == "__main__":
             username=os.getenv("POSTGRES_USER"),
             database=os.getenv("POSTGRES_DB_NAME")
         ),
-        "stager_config": PostgresUploadStagerConfig(),
         "uploader_config": PostgresUploaderConfig(table_name=os.getenv("POSTGRES_TABLE_NAME"))
     }
 
@@ -66,5 +66,12 @@ if __name__ == "__main__":
             chunk_overlap=20
         )
 
+    check_embedder_dimensions(pipeline_configs["embedder_config"], os.getenv("POSTGRES_TABLE_NAME"))
 
-    Pipeline.from_configs(**pipeline_configs).run()
+    pipeline = Pipeline.from_configs(**pipeline_configs)
+    # No stager: the uploader reads the embedder output and COPYs it directly
+    pipeline.uploader_step.process = CopyPostgresUploader(
+        upload_config=pipeline_configs["uploader_config"],
+        connection_config=pipeline_configs["destination_connection_config"],
+    )
+    pipeline.run()
@@ -11,6 +11,7 @@ import * as custom_resources from "aws-cdk-lib/custom-resources";
 import * as iam from "aws-cdk-lib/aws-iam";
 import * as dotenv from "dotenv";
 import * as logs from "aws-cdk-lib/aws-logs";
+import { PostgresJobScripts } from "./postgres_job_scripts";
 
 dotenv.config();
 
@@ -93,6 +94,17 @@ export class Dropbox_Postgres_CDK_Stack extends cdk.Stack {
       ],
     });
 
+    // Role the Batch jobs run as
+    const batchJobRole = new iam.Role(this, "BatchJobRole", {
+      assumedBy: new iam.ServicePrincipal("ecs-tasks.amazonaws.com"),
+    });
+
+    // Scripts the Batch jobs download and run
+    const jobScripts = new PostgresJobScripts(this, "JobScripts", {
+      scriptPath: "lambda/dropbox_postgres_lambda/dropbox_postgres_ingest.py",
+      jobRole: batchJobRole,
+    });
+
     // Batch Job Definition with ARM64 architecture
     const jobDefinition = new batch.CfnJobDefinition(this, "MyBatchJobDef", {
       type: "container",
@@ -102,9 +114,8 @@ export class Dropbox_Postgres_CDK_Stack extends cdk.Stack {
           { type: "VCPU", value: process.env.CONTAINER_VCPU },
           { type: "MEMORY", value: process.env.CONTAINER_MEMORY },
         ],
-        jobRoleArn: new iam.Role(this, "BatchJobRole", {
-          assumedBy: new iam.ServicePrincipal("ecs-tasks.amazonaws.com"),
-        }).roleArn,
+        environment: jobScripts.environment,
+        jobRoleArn: batchJobRole.roleArn,
         executionRoleArn: batchExecutionRole.roleArn,
         runtimePlatform: {
           cpuArchitecture: "ARM64",
@@ -161,6 +172,9 @@ export class Dropbox_Postgres_CDK_Stack extends cdk.Stack {
         POSTGRES_TABLE_NAME: process.env.POSTGRES_TABLE_NAME!,
         CHUNKING_STRATEGY: process.env.CHUNKING_STRATEGY!,
         CHUNKING_MAX_CHARACTERS: process.env.CHUNKING_MAX_CHARACTERS!,
+        INGEST_NUM_PROCESSES: process.env.INGEST_NUM_PROCESSES || "",
+        EMBEDDING_BATCH_SIZE: process.env.EMBEDDING_BATCH_SIZE || "",
+        EMBEDDING_TORCH_DTYPE: process.env.EMBEDDING_TORCH_DTYPE || "",
         EMBEDDING_MODEL_NAME: process.env.EMBEDDING_MODEL_NAME!,
         EMBEDDING_PROVIDER: process.env.EMBEDDING_PROVIDER!,
         EMBEDDING_PROVIDER_API_KEY:
@@ -0,0 +1,60 @@
+import * as fs from "fs";
+import { Stack } from "aws-cdk-lib";
+import * as batch from "aws-cdk-lib/aws-batch";
+import * as iam from "aws-cdk-lib/aws-iam";
+import * as s3_assets from "aws-cdk-lib/aws-s3-assets";
+import { Construct } from "constructs";
+
+// Runs as APP_SCRIPT and fetches the job's actual script (see the file itself)
+const APP_SCRIPT_LOADER_PATH = "lambda/postgres_ingest_shared/app_script_loader.py";
+// Module the scripts share; the loader makes it importable
+const APP_MODULE_PATH = "lambda/postgres_ingest_shared/postgres_ingest_utils.py";
+
+export interface PostgresJobScriptsProps {
+  // Script run by jobs of a definition using `environment`
+  scriptPath: string;
+  // Role the Batch jobs run as; it is granted read access to every script
+  jobRole: iam.IRole;
+}
+
+// Publishes the scripts run by the Postgres ingest jobs as S3 assets, and
+// builds the job definition environment that makes each job load its script
+// from there rather than from its container overrides.
+export class PostgresJobScripts extends Construct {
+  public readonly environment: batch.CfnJobDefinition.EnvironmentProperty[];
+  private readonly jobRole: iam.IRole;
+  private readonly sharedModule: s3_assets.Asset;
+
+  constructor(scope: Construct, id: string, props: PostgresJobScriptsProps) {
+    super(scope, id);
+    this.jobRole = props.jobRole;
+
+    this.sharedModule = this.addScript("Module", APP_MODULE_PATH);
+    this.environment = this.environmentFor(
+      this.addScript("Script", props.scriptPath)
+    );
+  }
+
+  public addScript(id: string, scriptPath: string): s3_assets.Asset {
+    const asset = new s3_assets.Asset(this, id, { path: scriptPath });
+    asset.grantRead(this.jobRole);
+    return asset;
+  }
+
+  // Job definition environment that runs the given script
+  public environmentFor(
+    script: s3_assets.Asset
+  ): batch.CfnJobDefinition.EnvironmentProperty[] {
+    return [
+      {
+        name: "APP_SCRIPT",
+        value: fs.readFileSync(APP_SCRIPT_LOADER_PATH, "utf8"),
+      },
+      { name: "APP_SCRIPT_S3_REGION", value: Stack.of(this).region },
+      // Every file asset of a stack goes to the same staging bucket
+      { name: "APP_SCRIPT_S3_BUCKET", value: script.s3BucketName },
+      { name: "APP_SCRIPT_S3_KEY", value: script.s3ObjectKey },
+      { name: "APP_MODULE_S3_KEY", value: this.sharedModule.s3ObjectKey },
+    ];
+  }
+}
@@ -10,6 +10,7 @@ import * as logs from "aws-cdk-lib/aws-logs";
 import * as custom_resources from "aws-cdk-lib/custom-resources";
 import * as dotenv from "dotenv";
 import { Construct } from "constructs";
+import { PostgresJobScripts } from "./postgres_job_scripts";
 
 dotenv.config();
 
@@ -90,6 +91,17 @@ export class S3_Postgres_CDK_Stack extends Stack {
       ],
     });
 
+    // Role the Batch jobs run as
+    const batchJobRole = new iam.Role(this, "BatchJobRole", {
+      assumedBy: new iam.ServicePrincipal("ecs-tasks.amazonaws.com"),
+    });
+
+    // Scripts the Batch jobs download and run
+    const jobScripts = new PostgresJobScripts(this, "JobScripts", {
+      scriptPath: "lambda/s3_postgres_lambda/s3_postgres_ingest.py",
+      jobRole: batchJobRole,
+    });
+
     // Batch Job Definition with ARM64 architecture
     const jobDefinition = new batch.CfnJobDefinition(this, "MyBatchJobDef", {
       type: "container",
@@ -99,9 +111,36 @@ export class S3_Postgres_CDK_Stack extends Stack {
           { type: "VCPU", value: process.env.CONTAINER_VCPU },
           { type: "MEMORY", value: process.env.CONTAINER_MEMORY },
         ],
-        jobRoleArn: new iam.Role(this, "BatchJobRole", {
-          assumedBy: new iam.ServicePrincipal("ecs-tasks.amazonaws.com"),
-        }).roleArn,
+        environment: jobScripts.environment,
+        jobRoleArn: batchJobRole.roleArn,
+        executionRoleArn: batchExecutionRole.roleArn,
+        runtimePlatform: {
+          cpuArchitecture: "ARM64",
+          operatingSystemFamily: "LINUX",
+        },
+      },
+      platformCapabilities: ["FARGATE"],
+    });
+
+    // Rebuilds the embeddings index after the initial bulk load. The job only
+    // waits for the ingest jobs and then has Postgres build the index, so it
+    // gets the smallest Fargate size; it keeps the ingest image, which has
+    // psycopg2 and botocore.
+    const indexJobDefinition = new batch.CfnJobDefinition(this, "IndexJobDef", {
+      type: "container",
+      containerProperties: {
+        image: "public.ecr.aws/y7z1l4m8/unstructured_ingest_psql_edit2:latest",
+        resourceRequirements: [
+          { type: "VCPU", value: "0.25" },
+          { type: "MEMORY", value: "512" },
+        ],
+        environment: jobScripts.environmentFor(
+          jobScripts.addScript(
+            "IndexScript",
+            "lambda/s3_postgres_lambda/index_postgres.py"
+          )
+        ),
+        jobRoleArn: batchJobRole.roleArn,
         executionRoleArn: batchExecutionRole.roleArn,
         runtimePlatform: {
           cpuArchitecture: "ARM64",
@@ -111,6 +150,15 @@ export class S3_Postgres_CDK_Stack extends Stack {
       platformCapabilities: ["FARGATE"],
     });
 
+    // The index job polls the ingest jobs' status; ListJobs has no
+    // resource-level permissions
+    batchJobRole.addToPolicy(
+      new iam.PolicyStatement({
+        actions: ["batch:ListJobs"],
+        resources: ["*"],
+      })
+    );
+
     // Create a role for the Lambda functions
     const lambdaExecutionRole = new iam.Role(this, "LambdaExecutionRole", {
       assumedBy: new iam.ServicePrincipal("lambda.amazonaws.com"),
@@ -142,6 +190,7 @@ export class S3_Postgres_CDK_Stack extends Stack {
       environment: {
         JOB_QUEUE: jobQueue.ref,
         JOB_DEFINITION: jobDefinition.ref,
+        INDEX_JOB_DEFINITION: indexJobDefinition.ref,
         MY_AWS_ACCESS_KEY_ID: process.env.MY_AWS_ACCESS_KEY_ID!,
         MY_AWS_SECRET_ACCESS_KEY: process.env.MY_AWS_SECRET_ACCESS_KEY!,
         EMBEDDING_PROVIDER: process.env.EMBEDDING_PROVIDER!,
@@ -150,6 +199,9 @@ export class S3_Postgres_CDK_Stack extends Stack {
           process.env.EMBEDDING_PROVIDER_API_KEY || "",
         CHUNKING_STRATEGY: process.env.CHUNKING_STRATEGY || "",
         CHUNKING_MAX_CHARACTERS: process.env.CHUNKING_MAX_CHARACTERS || "",
+        INGEST_NUM_PROCESSES: process.env.INGEST_NUM_PROCESSES || "",
+        EMBEDDING_BATCH_SIZE: process.env.EMBEDDING_BATCH_SIZE || "",
+        EMBEDDING_TORCH_DTYPE: process.env.EMBEDDING_TORCH_DTYPE || "",
         POSTGRES_DB_NAME: process.env.POSTGRES_DB_NAME!,
         POSTGRES_USER: process.env.POSTGRES_USER!,
         POSTGRES_PASSWORD: process.env.POSTGRES_PASSWORD!,
@@ -158,6 +210,7 @@ export class S3_Postgres_CDK_Stack extends Stack {
         POSTGRES_TABLE_NAME: process.env.POSTGRES_TABLE_NAME!,
         S3_BUCKET_NAME: process.env.S3_BUCKET_NAME!,
         S3_NOTIFICATION_PREFIX: process.env.S3_NOTIFICATION_PREFIX || "",
+        DEBUG: process.env.DEBUG || "",
       },
       timeout: cdk.Duration.seconds(30),
     });
@@ -166,7 +219,7 @@ export class S3_Postgres_CDK_Stack extends Stack {
     addLambda.addToRolePolicy(
       new iam.PolicyStatement({
         actions: ["batch:SubmitJob"],
-        resources: [jobQueue.ref, jobDefinition.ref],
+        resources: [jobQueue.ref, jobDefinition.ref, indexJobDefinition.ref],
       })
     );
 
@@ -193,6 +246,7 @@ export class S3_Postgres_CDK_Stack extends Stack {
         POSTGRES_HOST: process.env.POSTGRES_HOST!,
         POSTGRES_PORT: process.env.POSTGRES_PORT!,
         POSTGRES_TABLE_NAME: process.env.POSTGRES_TABLE_NAME!,
+        DEBUG: process.env.DEBUG || "",
       },
       timeout: cdk.Duration.seconds(30),
     });
@@ -0,0 +1,118 @@
+import os
+import sys
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "lambda", "s3_postgres_lambda"))
+
+for name, value in {
+    "AWS_DEFAULT_REGION": "us-east-1",
+    "JOB_QUEUE": "job-queue",
+    "JOB_DEFINITION": "ingest-job-definition",
+    "INDEX_JOB_DEFINITION": "index-job-definition",
+    "S3_BUCKET_NAME": "bucket",
+    "MY_AWS_ACCESS_KEY_ID": "key",
+    "MY_AWS_SECRET_ACCESS_KEY": "secret",
+    "POSTGRES_DB_NAME": "postgres",
+    "POSTGRES_USER": "postgres",
+    "POSTGRES_PASSWORD": "password",
+    "POSTGRES_HOST": "localhost",
+    "POSTGRES_PORT": "5432",
+    "POSTGRES_TABLE_NAME": "public.elements",
+    "EMBEDDING_PROVIDER": "huggingface",
+    "EMBEDDING_MODEL_NAME": "model",
+    "EMBEDDING_PROVIDER_API_KEY": "",
+    "CHUNKING_STRATEGY": "basic",
+    "CHUNKING_MAX_CHARACTERS": "1500",
+}.items():
+    os.environ.setdefault(name, value)
+
+import add_lambda_function  # noqa: E402
+
+
+class StubPaginator:
+    def __init__(self, pages):
+        self.pages = pages
+        self.calls = []
+
+    def paginate(self, **kwargs):
+        self.calls.append(kwargs)
+        return iter(self.pages)
+
+
+class StubS3Client:
+    def __init__(self, keys):
+        contents = [{"Key": key, "Size": 0 if key.endswith("/") else 1} for key in keys]
+        self.paginator = StubPaginator([{"Contents": contents}])
+
+    def get_paginator(self, operation_name):
+        return self.paginator
+
+
+class StubBatchClient:
+    def __init__(self):
+        self.submitted = []
+
+    def submit_job(self, **kwargs):
+        self.submitted.append(kwargs)
+        return {"jobId": f"job-{len(self.submitted)}"}
+
+
+def environment_of(job):
+    return {variable["name"]: variable["value"] for variable in job["containerOverrides"]["environment"]}
+
+
+class InitialIngestionTest(unittest.TestCase):
+    def run_custom_resource_event(self, keys):
+        batch_client = StubBatchClient()
+        with mock.patch.object(add_lambda_function, "batch_client", batch_client), \
+                mock.patch.object(add_lambda_function, "s3_client", StubS3Client(keys)), \
+                mock.patch.object(add_lambda_function, "drop_embedding_index") as drop_embedding_index:
+            add_lambda_function.lambda_handler({"RequestType": "Create"}, None)
+        drop_embedding_index.assert_called_once_with()
+        return batch_client.submitted
+
+    def test_one_index_job_follows_the_ingest_jobs(self):
+        submitted = self.run_custom_resource_event(["a.pdf", "folder/", "folder/b.pdf", "c.txt"])
+
+        ingest_jobs = [job for job in submitted if job["jobDefinition"] == "ingest-job-definition"]
+        index_jobs = [job for job in submitted if job["jobDefinition"] == "index-job-definition"]
+        self.assertEqual(len(ingest_jobs), 3)
+        self.assertEqual(len(index_jobs), 1)
+        self.assertIs(submitted[-1], index_jobs[0])
+
+        # Fan-in: the index job depends on no job, but finds every ingest job
+        # of this bulk load by its name prefix
+        index_job = index_jobs[0]
+        self.assertNotIn("dependsOn", index_job)
+        index_environment = environment_of(index_job)
+        prefix = index_environment["BULK_LOAD_JOB_PREFIX"]
+        self.assertTrue(prefix.startswith("BulkLoad_"))
+        for job in ingest_jobs:
+            self.assertTrue(job["jobName"].startswith(prefix))
+            self.assertNotIn("dependsOn", job)
+        self.assertFalse(index_job["jobName"].startswith(prefix))
+        self.assertEqual(
+            sorted(environment_of(job)["AWS_S3_URL"] for job in ingest_jobs),
+            ["s3://bucket/a.pdf", "s3://bucket/c.txt", "s3://bucket/folder/b.pdf"],
+        )
+
+        self.assertEqual(index_environment["JOB_QUEUE"], "job-queue")
+        self.assertEqual(index_environment["EMBEDDING_INDEX_NAME"], "ix_elements_embeddings")
+        self.assertEqual(index_environment["POSTGRES_TABLE_NAME"], "public.elements")
+        self.assertNotIn("AWS_SECRET_ACCESS_KEY", index_environment)
+
+    def test_index_is_rebuilt_for_an_empty_bucket(self):
+        submitted = self.run_custom_resource_event(["folder/"])
+
+        self.assertEqual([job["jobDefinition"] for job in submitted], ["index-job-definition"])
+
+    def test_each_bulk_load_has_its_own_prefix(self):
+        first = environment_of(self.run_custom_resource_event(["a.pdf"])[-1])
+        second = environment_of(self.run_custom_resource_event(["a.pdf"])[-1])
+
+        self.assertNotEqual(first["BULK_LOAD_JOB_PREFIX"], second["BULK_LOAD_JOB_PREFIX"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,91 @@
+import os
+import sys
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "lambda", "s3_postgres_lambda"))
+
+import index_postgres  # noqa: E402
+
+
+class StubPaginator:
+    def __init__(self, pages):
+        self.pages = pages
+        self.calls = []
+
+    def paginate(self, **kwargs):
+        self.calls.append(kwargs)
+        return iter(self.pages)
+
+
+class StubListJobsClient:
+    # Returns one poll's job statuses per round of ListJobs pages
+    def __init__(self, polls):
+        self.polls = iter(polls)
+        self.paginators = []
+
+    def get_paginator(self, operation_name):
+        self.paginators.append(StubPaginator(next(self.polls)))
+        return self.paginators[-1]
+
+
+def job_summaries(*statuses):
+    return {"jobSummaryList": [{"status": status} for status in statuses]}
+
+
+class WaitForJobsTest(unittest.TestCase):
+    def test_waits_until_no_job_is_active(self):
+        batch_client = StubListJobsClient([
+            [job_summaries("RUNNING", "SUCCEEDED"), job_summaries("RUNNABLE")],
+            [job_summaries("SUCCEEDED", "SUCCEEDED"), job_summaries("STARTING")],
+            [job_summaries("SUCCEEDED", "SUCCEEDED"), job_summaries("FAILED")],
+        ])
+
+        with mock.patch("builtins.print"):
+            statuses = index_postgres.wait_for_jobs(batch_client, "job-queue", "BulkLoad_1_", poll_seconds=0)
+
+        self.assertEqual(len(batch_client.paginators), 3)
+        self.assertEqual(statuses["SUCCEEDED"], 2)
+        self.assertEqual(statuses["FAILED"], 1)
+        self.assertEqual(
+            batch_client.paginators[0].calls,
+            [{"jobQueue": "job-queue", "filters": [{"name": "JOB_NAME", "values": ["BulkLoad_1_*"]}]}],
+        )
+
+    def test_failed_jobs_do_not_block_the_index(self):
+        batch_client = StubListJobsClient([[job_summaries("FAILED", "FAILED")]])
+
+        statuses = index_postgres.wait_for_jobs(batch_client, "job-queue", "BulkLoad_1_", poll_seconds=0)
+
+        self.assertEqual(statuses["FAILED"], 2)
+
+
+class StubCursor:
+    def __init__(self, row):
+        self.row = row
+
+    def execute(self, query, parameters=None):
+        self.parameters = parameters
+
+    def fetchone(self):
+        return self.row
+
+
+class GetOperatorClassTest(unittest.TestCase):
+    def test_operator_class_follows_column_type(self):
+        cursor = StubCursor(("halfvec",))
+
+        self.assertEqual(index_postgres.get_operator_class(cursor, "public.elements"), "halfvec_cosine_ops")
+        self.assertEqual(cursor.parameters, ("elements", "public"))
+
+    def test_missing_column(self):
+        with self.assertRaisesRegex(ValueError, "elements has no embeddings column"):
+            index_postgres.get_operator_class(StubCursor(None), "elements")
+
+    def test_unsupported_column_type(self):
+        with self.assertRaisesRegex(ValueError, "elements.embeddings is of type bytea"):
+            index_postgres.get_operator_class(StubCursor(("bytea",)), "elements")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,121 @@
+import json
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "lambda", "postgres_ingest_shared"))
+
+from postgres_ingest_utils import (  # noqa: E402
+    CopyStream,
+    escape_copy_text,
+    quote_array_item,
+    to_postgres_text,
+)
+
+
+class EscapeCopyTextTest(unittest.TestCase):
+    def test_none_is_null_marker(self):
+        self.assertEqual(escape_copy_text(None), "\\N")
+
+    def test_escapes_backslash_and_delimiters(self):
+        self.assertEqual(escape_copy_text("a\\b\tc\nd\re"), "a\\\\b\\tc\\nd\\re")
+
+    def test_plain_text_is_unchanged(self):
+        self.assertEqual(escape_copy_text("plain text"), "plain text")
+
+
+class QuoteArrayItemTest(unittest.TestCase):
+    def test_none_is_null(self):
+        self.assertEqual(quote_array_item(None), "NULL")
+
+    def test_quotes_and_backslashes_are_escaped(self):
+        self.assertEqual(quote_array_item('say "hi" \\o/'), '"say \\"hi\\" \\\\o/"')
+
+    def test_dict_items_are_json(self):
+        item = {"text": "x", "url": "https://example.com"}
+        quoted = quote_array_item(item)
+        self.assertEqual(quoted, '"' + json.dumps(item).replace('"', '\\"') + '"')
+
+
+class ToPostgresTextTest(unittest.TestCase):
+    def test_none_stays_none(self):
+        self.assertIsNone(to_postgres_text(None, "text"))
+
+    def test_vector_literal(self):
+        self.assertEqual(to_postgres_text([1, 0.5, -2], "vector"), "[1.0,0.5,-2.0]")
+
+    def test_halfvec_literal_is_rounded_to_float16(self):
+        self.assertEqual(to_postgres_text([1 / 3, 2], "halfvec"), "[0.3333,2.0]")
+
+    def test_vector_string_passes_through(self):
+        self.assertEqual(to_postgres_text("[1,2]", "vector"), "[1,2]")
+
+    def test_array_literal(self):
+        self.assertEqual(to_postgres_text(["eng", None], "_text"), '{"eng",NULL}')
+
+    def test_scalar_becomes_one_item_array(self):
+        self.assertEqual(to_postgres_text("eng", "_text"), '{"eng"}')
+
+    def test_array_of_dicts(self):
+        links = [{"text": "a", "url": "b"}]
+        self.assertEqual(to_postgres_text(links, "_text"), "{" + quote_array_item(links[0]) + "}")
+
+    def test_integer_is_rounded(self):
+        self.assertEqual(to_postgres_text(595.28, "int4"), "595")
+
+    def test_unconvertible_values_become_null(self):
+        self.assertIsNone(to_postgres_text(float("inf"), "int4"))
+        self.assertIsNone(to_postgres_text("n/a", "int8"))
+        self.assertIsNone(to_postgres_text(float("nan"), "timestamptz"))
+        self.assertIsNone(to_postgres_text([1, None], "vector"))
+        self.assertIsNone(to_postgres_text([1e5], "halfvec"))
+
+    def test_epoch_timestamps(self):
+        self.assertEqual(to_postgres_text(0, "timestamptz"), "1970-01-01T00:00:00+00:00")
+        self.assertEqual(to_postgres_text(1_700_000_000_000, "timestamptz"), "2023-11-14T22:13:20+00:00")
+
+    def test_iso_timestamp_passes_through(self):
+        self.assertEqual(to_postgres_text("2024-01-02T03:04:05", "timestamp"), "2024-01-02T03:04:05")
+
+    def test_nested_values_are_json(self):
+        self.assertEqual(to_postgres_text({"a": 1}, "jsonb"), '{"a": 1}')
+
+
+class CopyStreamTest(unittest.TestCase):
+    rows = [["1", "a\tb", None], ["2", "line\nbreak", "x"], ["3", "", "y"]]
+    expected = "1\ta\\tb\t\\N\n2\tline\\nbreak\tx\n3\t\ty\n"
+
+    def test_read_all(self):
+        self.assertEqual(CopyStream(iter(self.rows)).read(), self.expected)
+
+    def test_read_in_chunks(self):
+        for size in (1, 5, 8, 1000):
+            stream = CopyStream(iter(self.rows))
+            chunks = []
+            while True:
+                chunk = stream.read(size)
+                if not chunk:
+                    break
+                self.assertLessEqual(len(chunk), size)
+                chunks.append(chunk)
+            self.assertEqual("".join(chunks), self.expected)
+
+    def test_rows_are_consumed_lazily(self):
+        consumed = []
+
+        def rows():
+            for row in self.rows:
+                consumed.append(row)
+                yield row
+
+        stream = CopyStream(rows())
+        self.assertEqual(consumed, [])
+        stream.read(3)
+        self.assertEqual(len(consumed), 1)
+
+    def test_empty(self):
+        self.assertEqual(CopyStream(iter([])).read(8192), "")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,114 @@
+import os
+import sys
+import unittest
+from unittest import mock
+
+import psycopg2
+import psycopg2.errors
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "lambda", "s3_postgres_lambda"))
+
+for name, value in {
+    "POSTGRES_DB_NAME": "postgres",
+    "POSTGRES_USER": "postgres",
+    "POSTGRES_PASSWORD": "password",
+    "POSTGRES_HOST": "localhost",
+    "POSTGRES_PORT": "5432",
+    "POSTGRES_TABLE_NAME": "public.elements",
+}.items():
+    os.environ.setdefault(name, value)
+
+import postgres_utils  # noqa: E402
+
+
+class StubCursor:
+    def __init__(self, connection):
+        self.connection = connection
+        self.rowcount = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def execute(self, query, parameters=None):
+        error = self.connection.error
+        if error is not None:
+            # A dropped connection is closed by the time its error is raised
+            if isinstance(error, (psycopg2.OperationalError, psycopg2.InterfaceError)):
+                self.connection.closed = 1
+            raise error
+        self.connection.statements.append(query)
+
+
+class StubConnection:
+    def __init__(self, error=None):
+        self.error = error
+        self.closed = 0
+        self.delete_prepared = False
+        self.statements = []
+        self.committed = False
+        self.rolled_back = False
+
+    def cursor(self):
+        return StubCursor(self)
+
+    def commit(self):
+        self.committed = True
+
+    def rollback(self):
+        self.rolled_back = True
+
+
+class StubPool:
+    def __init__(self, connections):
+        self.connections = iter(connections)
+        self.returned = []
+
+    def getconn(self):
+        return next(self.connections)
+
+    def putconn(self, connection, close=False):
+        self.returned.append((connection, close))
+
+
+class DeleteFromPostgresTest(unittest.TestCase):
+    def delete(self, connections):
+        pool = StubPool(connections)
+        with mock.patch.object(postgres_utils, "get_pool", return_value=pool), \
+                mock.patch.object(postgres_utils.time, "sleep") as sleep:
+            postgres_utils.delete_from_postgres(["a.pdf"])
+        return pool, sleep
+
+    def test_retries_on_a_fresh_connection(self):
+        broken = StubConnection(psycopg2.OperationalError("server closed the connection unexpectedly"))
+        healthy = StubConnection()
+
+        with self.assertLogs(postgres_utils.logger, "WARNING"):
+            pool, sleep = self.delete([broken, healthy])
+
+        self.assertEqual(pool.returned, [(broken, True), (healthy, False)])
+        self.assertTrue(healthy.committed)
+        sleep.assert_called_once_with(0.1)
+
+    def test_gives_up_after_the_last_attempt(self):
+        connections = [StubConnection(psycopg2.InterfaceError("connection already closed")) for _ in range(3)]
+
+        with self.assertLogs(postgres_utils.logger, "WARNING"), self.assertRaises(psycopg2.InterfaceError):
+            self.delete(connections)
+
+    def test_other_errors_are_raised_without_retry(self):
+        connection = StubConnection(psycopg2.errors.UndefinedTable("relation does not exist"))
+        pool = StubPool([connection])
+
+        with mock.patch.object(postgres_utils, "get_pool", return_value=pool), \
+                self.assertRaises(psycopg2.errors.UndefinedTable):
+            postgres_utils.delete_from_postgres(["a.pdf"])
+
+        self.assertTrue(connection.rolled_back)
+        self.assertEqual(pool.returned, [(connection, False)])
+
+
+if __name__ == "__main__":
+    unittest.main()